@@ -428,6 +428,10 @@ class ElementList(collections.MutableSequence):
 
 class ElementFinder(object):
 
+    #: parsed structures, keyed by element class, version and reference. They are shared by all the elements
+    #: with the same reference, so they must never be modified
+    _structures = {}
+
     @staticmethod
     def get_structure(element, reference=None):
         """
@@ -447,7 +451,14 @@ class ElementFinder(object):
                 raise InvalidName(element.classname, element.name)
         if not isinstance(reference, collections.Sequence):
             raise Exception
-        return ElementFinder._parse_structure(element, reference)
+        key = (element.classname, element.version, reference)
+        try:
+            return ElementFinder._structures[key]
+        except KeyError:
+            structure = ElementFinder._structures[key] = ElementFinder._parse_structure(element, reference)
+            return structure
+        except TypeError: # unhashable reference (e.g. a list)
+            return ElementFinder._parse_structure(element, reference)
 
     @staticmethod
     def _parse_structure(element, reference):
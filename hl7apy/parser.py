@@ -24,6 +24,7 @@ HL7apy - parsing functions
 """
 
 import re
+from collections import deque, namedtuple
 
 from hl7apy import get_default_encoding_chars, get_default_version, check_version, check_encoding_chars
 from hl7apy.consts import N_SEPS
@@ -31,6 +32,15 @@ from hl7apy.core import is_base_datatype, Message, Group, Segment, Field, Compon
 from hl7apy.exceptions import InvalidName, ParserError, InvalidEncodingChars
 from hl7apy.validation import Validator
 
+# kinds of the tokens returned by _tokenize_er7, from the outermost to the innermost level
+_SEGMENT, _FIELD, _REPETITION, _COMPONENT, _SUBCOMPONENT = range(5)
+_SEPARATORS = ('SEGMENT', 'FIELD', 'REPETITION', 'COMPONENT', 'SUBCOMPONENT')
+_SEPARATORS_RE = {}
+_STRUCTURE_CACHE = {}
+
+#: the parsing parameters shared by all the elements of a parsing call
+_ParseContext = namedtuple('_ParseContext', ('version', 'encoding_chars', 'validation_level', 'is_quiet', 'is_strict'))
+
 def parse_message(message, validation_level=None, find_groups=True, reference=None):
     """
     Parse the given ER7-encoded message and return an instance of :class:`hl7apy.core.Message`.
@@ -55,20 +65,23 @@ def parse_message(message, validation_level=None, find_groups=True, reference=No
     >>> print m.children
     [<Segment MSH>, <Group OML_O33_PATIENT>]
     """
-    message = message.lstrip()
+    message = message.strip()
     encoding_chars, message_structure, version = get_message_info(message)
 
     try:
         m = Message(name=message_structure, version=version, validation_level=validation_level, encoding_chars=encoding_chars)
     except InvalidName:
         m = Message(version=version, validation_level=validation_level, encoding_chars=encoding_chars)
-    children = parse_segments(message, m.version, encoding_chars, validation_level)
+    # the version has been validated by the message and the encoding chars by get_message_info
+    context = _ParseContext(m.version, encoding_chars, validation_level,
+                            Validator.is_quiet(validation_level), Validator.is_strict(validation_level))
+    children = _parse_segments(message, context)
     if m.name is not None and find_groups:
         m.children = []
         create_groups(m, children, validation_level)
     else:
         m.children = children
-    if Validator.is_strict(validation_level):
+    if context.is_strict:
         m.validate()
     return m
 
@@ -94,11 +107,27 @@ def parse_segments(text, version=None, encoding_chars=None, validation_level=Non
     >>> print parse_segments(segments)
     [<Segment EVN>, <Segment PID>]
     """
-    version = _get_version(version)
-    encoding_chars = _get_encoding_chars(encoding_chars)
-
-    segment_sep = encoding_chars['SEGMENT']
-    return [parse_segment(s.strip(), version, encoding_chars, validation_level) for s in text.split(segment_sep) if len(s) > 0]
+    context = _get_context(version, encoding_chars, validation_level)
+    return _parse_segments(text, context)
+
+def _parse_segments(text, context):
+    # version and encoding_chars are expected to be already validated by the caller
+    segment_sep = context.encoding_chars['SEGMENT']
+    separators_re = _get_separators_re(context.encoding_chars, _FIELD)
+    segments = []
+    start = 0
+    length = len(text)
+    # tokenize one segment at a time, so that only the tokens of the current segment are kept in memory
+    while start < length:
+        end = text.find(segment_sep, start)
+        if end == -1:
+            end = length
+        if end > start:
+            segment = text[start:end].strip()
+            tokens = _tokenize_er7(segment, context.encoding_chars, _FIELD, separators_re)
+            segments.append(_build_segment(segment, tokens, context))
+        start = end + 1
+    return segments
 
 def parse_segment(text, version=None, encoding_chars=None, validation_level=None, reference=None):
     """
@@ -128,13 +157,28 @@ def parse_segment(text, version=None, encoding_chars=None, validation_level=None
     >>> print s.to_er7()
     EVN||20080115153000||||20080114003000
     """
-    version = _get_version(version)
-    encoding_chars = _get_encoding_chars(encoding_chars)
+    context = _get_context(version, encoding_chars, validation_level)
+    return _parse_segment(text, context, reference)
 
+def _parse_segment(text, context, reference=None):
     segment_name = text[:3]
     text = text[4:] if segment_name != 'MSH' else text[3:]
-    segment = Segment(segment_name, version=version, validation_level=validation_level, reference=reference)
-    segment.children = parse_fields(text, segment_name, version, encoding_chars, validation_level, segment.allow_infinite_children)
+    segment = Segment(segment_name, version=context.version, validation_level=context.validation_level, reference=reference)
+    segment.children = _parse_fields(text, segment_name, context, segment.allow_infinite_children)
+    return segment
+
+def _build_segment(text, tokens, context, reference=None):
+    kind, start, end = tokens[0]
+    if end - start != 3:
+        return _parse_segment(text[start:tokens[-1][2]], context, reference)
+    segment_name = text[start:end]
+    if segment_name == 'MSH':
+        # the empty span before the first field separator stands for MSH_1
+        tokens = [(kind, end, end)] + tokens[1:]
+    else:
+        tokens = tokens[1:]
+    segment = Segment(segment_name, version=context.version, validation_level=context.validation_level, reference=reference)
+    segment.children = _build_fields(text, tokens, segment_name, context, segment.allow_infinite_children)
     return segment
 
 def parse_fields(text, name_prefix=None, version=None, encoding_chars=None, validation_level=None, force_varies=False):
@@ -174,24 +218,41 @@ def parse_fields(text, name_prefix=None, version=None, encoding_chars=None, vali
     >>> print s.to_er7()
     NK1||||||||||||||||||||||||||||||||||||||||1|NUCLEAR^NELDA^W|SPO|2222 HOME STREET^^ANN ARBOR^MI^^USA
     """
-    version = _get_version(version)
-    encoding_chars = _get_encoding_chars(encoding_chars)
+    context = _get_context(version, encoding_chars, validation_level)
+    return _parse_fields(text, name_prefix, context, force_varies)
 
+def _parse_fields(text, name_prefix, context, force_varies=False):
     text = text.strip("\r")
-    field_sep = encoding_chars['FIELD']
-    repetition_sep = encoding_chars['REPETITION']
-    splitted_fields = text.split(field_sep)
+    tokens = _tokenize_er7(text, context.encoding_chars, _FIELD)
+    return _build_fields(text, tokens, name_prefix, context, force_varies)
+
+def _build_fields(text, tokens, name_prefix, context, force_varies=False):
     fields = []
-    for index, field in enumerate(splitted_fields):
-        name = "{0}_{1}".format(name_prefix, index+1) if name_prefix is not None else None
-        if field.strip() or name is None:
-            if name == 'MSH_2':
-                fields.append(parse_field(field, name, version, encoding_chars, validation_level))
-            else:
-                for rep in field.split(repetition_sep):
-                    fields.append(parse_field(rep, name, version, encoding_chars, validation_level, force_varies=force_varies))
-        elif name == "MSH_1":
-            fields.append(parse_field(field_sep, name, version, encoding_chars, validation_level))
+    splitted_fields = _split_tokens(tokens, _FIELD)
+    first_index = 0
+    if name_prefix == 'MSH':
+        # MSH_1 and MSH_2 hold the encoding characters: MSH_1 is rebuilt from the field separator
+        # when it's empty and MSH_2 is never split into repetitions
+        first_index = 2
+        field_tokens = splitted_fields[0]
+        field = text[field_tokens[0][1]:field_tokens[-1][2]]
+        if field and not field.isspace():
+            for rep_tokens in _split_tokens(field_tokens, _REPETITION):
+                fields.append(_build_field(text, rep_tokens, 'MSH_1', context, force_varies=force_varies))
+        else:
+            fields.append(_parse_field(context.encoding_chars['FIELD'], 'MSH_1', context))
+        if len(splitted_fields) > 1:
+            field_tokens = splitted_fields[1]
+            field = text[field_tokens[0][1]:field_tokens[-1][2]]
+            if field and not field.isspace():
+                fields.append(_build_field(text, field_tokens, 'MSH_2', context))
+    for index in range(first_index, len(splitted_fields)):
+        field_tokens = splitted_fields[index]
+        name = "%s_%d" % (name_prefix, index+1) if name_prefix is not None else None
+        field = text[field_tokens[0][1]:field_tokens[-1][2]]
+        if (field and not field.isspace()) or name is None:
+            for rep_tokens in _split_tokens(field_tokens, _REPETITION):
+                fields.append(_build_field(text, rep_tokens, name, context, force_varies=force_varies))
     return fields
 
 def parse_field(text, name=None, version=None, encoding_chars=None, validation_level=None, reference=None, force_varies=False):
@@ -233,26 +294,31 @@ def parse_field(text, name=None, version=None, encoding_chars=None, validation_l
     >>> print unknown.to_er7()
     NUCLEAR^NELDA^W
     """
-    version = _get_version(version)
-    encoding_chars = _get_encoding_chars(encoding_chars)
+    context = _get_context(version, encoding_chars, validation_level)
+    return _parse_field(text, name, context, reference, force_varies)
 
+def _parse_field(text, name, context, reference=None, force_varies=False):
+    tokens = _tokenize_er7(text, context.encoding_chars, _COMPONENT)
+    return _build_field(text, tokens, name, context, reference, force_varies)
+
+def _build_field(text, tokens, name, context, reference=None, force_varies=False):
     try:
-        field = Field(name, version=version, validation_level=validation_level, reference=reference)
+        field = Field(name, version=context.version, validation_level=context.validation_level, reference=reference)
     except InvalidName:
         if force_varies:
             reference = ('leaf', 'varies', None, None)
-            field = Field(name, version=version, validation_level=validation_level, reference=reference)
+            field = Field(name, version=context.version, validation_level=context.validation_level, reference=reference)
         else:
-            field = Field(version=version, validation_level=validation_level, reference=reference)
+            field = Field(version=context.version, validation_level=context.validation_level, reference=reference)
 
     if name in ('MSH_1', 'MSH_2'):
-        s = SubComponent(datatype='ST', value=text)
+        s = SubComponent(datatype='ST', value=text[tokens[0][1]:tokens[-1][2]])
         c = Component(datatype='ST')
         c.add(s)
         field.add(c)
     else:
-        children = parse_components(text, field.datatype, version, encoding_chars, validation_level)
-        if Validator.is_quiet(validation_level) and is_base_datatype(field.datatype, version) and \
+        children = _build_components(text, tokens, field.datatype, context)
+        if context.is_quiet and is_base_datatype(field.datatype, context.version) and \
                 len(children) > 1:
             field.datatype = None
         field.children = children
@@ -286,24 +352,28 @@ def parse_components(text, field_datatype='ST', version=None, encoding_chars=Non
     >>> print parse_components(components)
     [<Component ST (None) of type ST>, <Component ST (None) of type ST>, <Component ST (None) of type ST>, <Component ST (None) of type ST>, <Component ST (None) of type ST>]
     """
-    version = _get_version(version)
-    encoding_chars = _get_encoding_chars(encoding_chars)
+    context = _get_context(version, encoding_chars, validation_level)
+    return _parse_components(text, field_datatype, context)
+
+def _parse_components(text, field_datatype, context):
+    tokens = _tokenize_er7(text, context.encoding_chars, _COMPONENT)
+    return _build_components(text, tokens, field_datatype, context)
+
+def _build_components(text, tokens, field_datatype, context):
+    is_base = is_base_datatype(field_datatype, context.version)
+    is_varies = field_datatype is None or field_datatype == 'varies'
+    if is_base:
+        component_datatype = field_datatype
+    else:
+        component_datatype = None
+        name_prefix = "VARIES_" if is_varies else field_datatype + "_"
 
-    component_sep = encoding_chars['COMPONENT']
     components = []
-    for index, component in enumerate(text.split(component_sep)):
-        if is_base_datatype(field_datatype, version):
-            component_datatype = field_datatype
-            component_name = None
-        elif field_datatype is None or field_datatype == 'varies':
-            component_datatype = None
-            component_name = 'VARIES_{0}'.format(index+1)
-        else:
-            component_name = "{0}_{1}".format(field_datatype, index+1)
-            component_datatype = None
-        if component.strip() or component_name is None or component_name.startswith("VARIES_"):
-            components.append(parse_component(component, component_name, component_datatype,
-                                              version, encoding_chars, validation_level))
+    for index, component_tokens in enumerate(_split_tokens(tokens, _COMPONENT)):
+        component_name = None if is_base else name_prefix + str(index+1)
+        component = text[component_tokens[0][1]:component_tokens[-1][2]]
+        if (component and not component.isspace()) or is_base or is_varies:
+            components.append(_build_component(text, component_tokens, component_name, component_datatype, context))
     return components
 
 def parse_component(text, name=None, datatype='ST', version=None, encoding_chars=None, validation_level=None, reference=None):
@@ -342,17 +412,22 @@ def parse_component(text, name=None, datatype='ST', version=None, encoding_chars
     >>> print parse_component(component)
     <Component ST (None) of type None>
     """
-    version = _get_version(version)
-    encoding_chars = _get_encoding_chars(encoding_chars)
+    context = _get_context(version, encoding_chars, validation_level)
+    return _parse_component(text, name, datatype, context, reference)
+
+def _parse_component(text, name, datatype, context, reference=None):
+    tokens = _tokenize_er7(text, context.encoding_chars, _SUBCOMPONENT)
+    return _build_component(text, tokens, name, datatype, context, reference)
 
+def _build_component(text, tokens, name, datatype, context, reference=None):
     try:
-        component = Component(name, datatype, version=version, validation_level=validation_level, reference=reference)
+        component = Component(name, datatype, version=context.version, validation_level=context.validation_level, reference=reference)
     except InvalidName as e:
-        if Validator.is_strict(validation_level):
+        if context.is_strict:
             raise e
-        component = Component(datatype, version=version, validation_level=validation_level, reference=reference)
-    children = parse_subcomponents(text, component.datatype, version, encoding_chars, validation_level)
-    if Validator.is_quiet(component.validation_level) and is_base_datatype(component.datatype, version) and \
+        component = Component(datatype, version=context.version, validation_level=context.validation_level, reference=reference)
+    children = _build_subcomponents(text, tokens, component.datatype, context)
+    if Validator.is_quiet(component.validation_level) and is_base_datatype(component.datatype, context.version) and \
             len(children) > 1:
         component.datatype = None
     component.children = children
@@ -394,20 +469,28 @@ def parse_subcomponents(text, component_datatype='ST', version=None, encoding_ch
     >>> print c.to_er7()
     &&&&&&&&&ID&TEST&&AHAH
     """
-    version = _get_version(version)
-    encoding_chars = _get_encoding_chars(encoding_chars)
+    context = _get_context(version, encoding_chars, validation_level)
+    return _parse_subcomponents(text, component_datatype, context)
+
+def _parse_subcomponents(text, component_datatype, context):
+    tokens = _tokenize_er7(text, context.encoding_chars, _SUBCOMPONENT)
+    return _build_subcomponents(text, tokens, component_datatype, context)
+
+def _build_subcomponents(text, tokens, component_datatype, context):
+    is_base = component_datatype is None or is_base_datatype(component_datatype, context.version)
+    if is_base:
+        subcomponent_datatype = component_datatype if component_datatype is not None else 'ST'
+    else:
+        subcomponent_datatype = None
+        name_prefix = component_datatype + "_"
 
-    subcomp_sep = encoding_chars['SUBCOMPONENT']
     subcomponents = []
-    for index, subcomponent in enumerate(text.split(subcomp_sep)):
-        if is_base_datatype(component_datatype, version) or component_datatype is None:
-            subcomponent_name = None
-            subcomponent_datatype = component_datatype if component_datatype is not None else 'ST'
-        else:
-            subcomponent_name = "{0}_{1}".format(component_datatype, index+1)
-            subcomponent_datatype = None
-        if subcomponent.strip() or subcomponent_name is None:
-            subcomponents.append(parse_subcomponent(subcomponent, subcomponent_name, subcomponent_datatype, version, validation_level))
+    for index, (kind, start, end) in enumerate(tokens):
+        subcomponent = text[start:end]
+        subcomponent_name = None if is_base else name_prefix + str(index+1)
+        if (subcomponent and not subcomponent.isspace()) or is_base:
+            subcomponents.append(parse_subcomponent(subcomponent, subcomponent_name, subcomponent_datatype,
+                                                    context.version, context.validation_level))
     return subcomponents
 
 def parse_subcomponent(text, name=None, datatype='ST', version=None, validation_level=None):
@@ -441,34 +524,34 @@ def get_message_info(content):
 
     :return: a tuple containing (encoding_chars, message_structure, version)
     """
-    regex = re.compile("^MSH(?P<field_sep>\S){1}")
-    m = regex.match(content)
-    if m is not None: # if the regular expression matches, it is an HL7 message
-        field_sep = m.group('field_sep') # get the field separator (first char after MSH)
-        msh = content.split("\r", 1)[0] # get the first segment
-        fields = msh.split(field_sep)
-        seps = fields[1] # get the remaining encoding chars (MSH.2)
+    # an HL7 message starts with MSH followed by the field separator
+    if not content.startswith('MSH') or len(content) < 4 or content[3].isspace():
+        raise ParserError("Invalid message")
+
+    field_sep = content[3] # get the field separator (first char after MSH)
+    msh = content.split("\r", 1)[0] # get the first segment
+    fields = msh.split(field_sep)
+    seps = fields[1] # get the remaining encoding chars (MSH.2)
+    if len(seps) != N_SEPS:
         if len(seps) > len(set(seps)):
             raise InvalidEncodingChars("Found duplicate encoding chars")
-        try:
-           comp_sep, rep_sep, escape, sub_sep = seps
-        except ValueError:
-            if len(seps) < N_SEPS:
-                raise InvalidEncodingChars('Missing required encoding chars')
-            else:
-                raise InvalidEncodingChars('Found {0} encoding chars'.format(len(seps)))
+        elif len(seps) < N_SEPS:
+            raise InvalidEncodingChars('Missing required encoding chars')
         else:
-            encoding_chars = {
-                'FIELD': field_sep,
-                'COMPONENT': comp_sep,
-                'SUBCOMPONENT': sub_sep,
-                'REPETITION': rep_sep,
-                'ESCAPE': escape,
-                'SEGMENT': '\r',
-                'GROUP': '\r',
-            }
-    else:
-        raise ParserError("Invalid message")
+            raise InvalidEncodingChars('Found {0} encoding chars'.format(len(seps)))
+    comp_sep, rep_sep, escape, sub_sep = seps[0], seps[1], seps[2], seps[3]
+    if comp_sep in seps[1:] or rep_sep in seps[2:] or escape == sub_sep:
+        raise InvalidEncodingChars("Found duplicate encoding chars")
+
+    encoding_chars = {
+        'FIELD': field_sep,
+        'COMPONENT': comp_sep,
+        'SUBCOMPONENT': sub_sep,
+        'REPETITION': rep_sep,
+        'ESCAPE': escape,
+        'SEGMENT': '\r',
+        'GROUP': '\r',
+    }
 
     # look for MSH.9 field (e.g. ADT^A01^ADT_A01) containing the message structure
     try:
@@ -476,7 +559,8 @@ def get_message_info(content):
     except IndexError:
         message_structure = None
     else:
-        message_type = msh_9.split(encoding_chars['COMPONENT'])
+        # only the first three components are needed
+        message_type = msh_9.split(encoding_chars['COMPONENT'], 3)
         try:
             message_structure = message_type[2]
         except IndexError:
@@ -491,11 +575,7 @@ def get_message_info(content):
     except IndexError:
         version = None
     else:
-        version_id = msh_12.split(encoding_chars['COMPONENT'])
-        try:
-            version = version_id[0]
-        except:
-            version = None
+        version = msh_12.partition(encoding_chars['COMPONENT'])[0]
 
     return encoding_chars, message_structure, version
 
@@ -511,13 +591,13 @@ def create_groups(message, children, validation_level=None):
 
     """
     # get the message structure
-    structure = ElementFinder.get_structure(message)
+    structure = _get_structure(message)
     # create the initial search data structure
     search_data = {'parents': [message], 'indexes': [-1], 'structures': [structure]}
     # for each segment found in the message...
     for c in children:
         found = -1
-        for x in xrange(len(search_data['structures'])):
+        for x in range(len(search_data['structures'])):
             found = _find_group(c, search_data, validation_level)
             # group not found at the current level, go back to the previous level
             if found == -1:
@@ -536,7 +616,7 @@ def _go_back(search_data):
 
 def _find_group(segment, search_data, validation_level=None):
     """
-    Recursively find the group the segment belongs to
+    Find the group the segment belongs to
 
     :param segment: a :class:`hl7apy.core.Segment` instance
 
@@ -546,42 +626,143 @@ def _find_group(segment, search_data, validation_level=None):
 
     :return: the index of the parent children list where the segment has been found
     """
-    search_index = -1
-    current_index = search_data['indexes'][-1]
-    structure = search_data['structures'][-1]
-    try:
-        search_index = structure['structure_by_name'].keys().index(segment.name)
-    except ValueError:
-        # groups of the current parent
-        groups = [k for k, v in structure['structure_by_name'].iteritems() if v['cls'] == Group]
-        # for any group found, create the group and check if the segment is one of its children
-        for g in groups:
-            group = Group(g, version=segment.version, validation_level=validation_level)
-            p_structure = ElementFinder.get_structure(group)
-            search_data['structures'].append(p_structure)
-            search_data['parents'].append(group)
-            search_data['indexes'].append(-1)
-            found_index = _find_group(segment, search_data, validation_level)
-            # the segment is a child of the current group
-            if found_index > -1:
-                find_parent = search_data['parents'].index(group) - 1
-                group.parent = search_data['parents'][find_parent]
-                search_index = structure['structure_by_name'].keys().index(g)
-                search_data['indexes'][find_parent] = search_index
-                break
-            else: # the segment is not a child of the current group, continue the search
-                _go_back(search_data)
-    else:
-        if search_index <= current_index and structure['repetitions'][segment.name][1] == 1:
-        # if more than one instance of the segment has been found and only one instance is allowed,
-        # go up of one level to create another instance of the group the segment belongs to
+    while True:
+        structure = search_data['structures'][-1]
+        search_index = structure['_name_to_index'].get(segment.name, -1)
+        if search_index == -1:
+            break
+        if search_index <= search_data['indexes'][-1] and structure['repetitions'][segment.name][1] == 1:
+            # if more than one instance of the segment has been found and only one instance is allowed,
+            # go up of one level to create another instance of the group the segment belongs to
             _go_back(search_data)
-            return _find_group(segment, search_data, validation_level)
+            continue
         search_data['indexes'][-1] = search_index
-        parent = search_data['parents'][-1]
-        parent.add(segment)
+        search_data['parents'][-1].add(segment)
+        return search_index
+
+    # depth-first search of the segment among the groups of the current parent: path holds the
+    # (name, structure) of the groups being visited and stack the groups still to be visited at each level
+    path = []
+    stack = deque([iter(structure['_groups'])])
+    while stack:
+        try:
+            group_name = next(stack[-1])
+        except StopIteration:
+            stack.pop()
+            if path:
+                path.pop()
+            continue
+        group_structure = _get_group_structure(group_name, segment.version)
+        path.append((group_name, group_structure))
+        found_index = group_structure['_name_to_index'].get(segment.name, -1)
+        if found_index > -1:
+            break
+        stack.append(iter(group_structure['_groups']))
+    else:
+        return -1
+
+    # the segment is a child of the last group of the path: create the groups and update the search data
+    groups = [Group(group_name, version=segment.version, validation_level=validation_level)
+              for group_name, _ in path]
+    groups[-1].add(segment)
+    for index in range(len(groups) - 1, 0, -1):
+        groups[index].parent = groups[index-1]
+    groups[0].parent = search_data['parents'][-1]
+
+    search_index = structure['_name_to_index'][path[0][0]]
+    search_data['indexes'][-1] = search_index
+    for index, group in enumerate(groups):
+        group_structure = path[index][1]
+        if index < len(path) - 1:
+            child_index = group_structure['_name_to_index'][path[index+1][0]]
+        else:
+            child_index = found_index
+        search_data['parents'].append(group)
+        search_data['structures'].append(group_structure)
+        search_data['indexes'].append(child_index)
     return search_index
 
+def _get_structure(element):
+    # the structures are only read during the groups search, so they can be shared by all the messages
+    key = (element.classname, element.name, element.version)
+    try:
+        return _STRUCTURE_CACHE[key]
+    except KeyError:
+        # copy the structure, since the one returned by the finder is shared with the elements
+        structure = dict(ElementFinder.get_structure(element))
+        children = structure['structure_by_name']
+        structure['_name_to_index'] = {name: index for index, name in enumerate(children)}
+        structure['_groups'] = [k for k, v in children.items() if v['cls'] == Group]
+        _STRUCTURE_CACHE[key] = structure
+        return structure
+
+def _get_group_structure(name, version):
+    try:
+        return _STRUCTURE_CACHE[('Group', name, version)]
+    except KeyError:
+        return _get_structure(Group(name, version=version))
+
+def _get_separators_re(encoding_chars, top_level):
+    # the regex matching the separators from top_level down and the map from each separator to its level
+    separators = tuple(encoding_chars[_SEPARATORS[level]] for level in range(top_level, _SUBCOMPONENT + 1))
+    try:
+        return _SEPARATORS_RE[separators]
+    except KeyError:
+        regex = re.compile('[{0}]'.format(''.join(re.escape(sep) for sep in separators)))
+        kinds = {sep: level for level, sep in enumerate(separators, top_level)}
+        _SEPARATORS_RE[separators] = regex, kinds
+        return regex, kinds
+
+def _tokenize_er7(text, encoding_chars, top_level=_SEGMENT, separators_re=None):
+    """
+    Scan the given ER7-encoded text once and split it in the spans delimited by the separators
+
+    :param text: the ER7-encoded text
+
+    :param encoding_chars: a dictionary containing the encoding chars
+
+    :param top_level: the outermost level whose separator has to be recognized (e.g. ``_FIELD`` to ignore
+        the segment separator). The separators of the inner levels are always recognized
+
+    :param separators_re: the result of ``_get_separators_re`` for ``encoding_chars`` and ``top_level``,
+        to avoid resolving it again when tokenizing many texts with the same encoding chars
+
+    :return: a list of ``(kind, start, end)`` tuples, one for each span ``text[start:end]``, where ``kind``
+        is the level of the separator closing the span. The last span is always closed by ``_SEGMENT``
+    """
+    regex, kinds = separators_re or _get_separators_re(encoding_chars, top_level)
+
+    # the scan for the separators runs inside the regex engine: the python loop below only
+    # runs once per separator found, so the cost is dominated by the elements creation
+    tokens = []
+    start = 0
+    for m in regex.finditer(text):
+        position = m.start()
+        tokens.append((kinds[text[position]], start, position))
+        start = position + 1
+    tokens.append((_SEGMENT, start, len(text)))
+    return tokens
+
+def _split_tokens(tokens, level):
+    # group the tokens in the spans closed by a separator of the given level or of an outer one
+    if len(tokens) == 1: # no separators at all (e.g. a field made of a single component)
+        return [tokens]
+    groups = []
+    group = []
+    for token in tokens:
+        group.append(token)
+        if token[0] <= level:
+            groups.append(group)
+            group = []
+    return groups
+
+def _get_context(version, encoding_chars, validation_level):
+    # validate the arguments of the public parsing functions once for all the elements to be parsed
+    version = _get_version(version)
+    encoding_chars = _get_encoding_chars(encoding_chars)
+    return _ParseContext(version, encoding_chars, validation_level,
+                         Validator.is_quiet(validation_level), Validator.is_strict(validation_level))
+
 def _get_version(version):
     if version is None:
         version = get_default_version()
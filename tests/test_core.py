@@ -372,6 +372,13 @@ class TestField(unittest.TestCase):
         f = Field ('PID_1', datatype='varies')
         self.assertEqual(f.datatype, 'varies')
 
+    def test_structure_shared_among_fields(self):
+        f1 = Field('pid_5')
+        f2 = Field('pid_5')
+        self.assertIs(f1.structure_by_name, f2.structure_by_name)
+        f3 = Field('pid_5', version='2.6')
+        self.assertIsNot(f1.structure_by_name, f3.structure_by_name)
+
     def test_add_empty_component(self):
         f1 = Field('pid_3', validation_level=VALIDATION_LEVEL.STRICT)
         self.assertRaises(ChildNotValid, f1.add, Component(datatype='ST'))
@@ -85,6 +85,16 @@ class TestParser(unittest.TestCase):
         m_string = message.to_er7()
         self.assertEqual(m_string, str_message)
 
+    def test_parse_message_crlf(self):
+        msh = 'MSH|^~\&|SENDING APP|SENDING FAC|REC APP|REC FAC|20080115153000||ADT^A01^ADT_A01|0123456789|P|2.5||||AL\r\n'
+        evn = 'EVN||20080115153000||AAA|AAA|20080114003000\r\n'
+        pid = 'PID|1||123-456-789^^^HOSPITAL^MR||SURNAME^NAME^A|||M|||1111 SOMEWHERE STREET^^SOMEWHERE^^^USA||555-555-2004~444-333-222|||M\r\n'
+
+        message = parse_message(msh+evn+pid, find_groups=False)
+        self.assertEqual(len(message.children), 3)
+        self.assertEqual(message.children[2].name, 'PID')
+        self.assertEqual(message.to_er7(), (msh+evn+pid).replace('\n', '').rstrip('\r'))
+
     def test_parse_message_create_groups(self):
         msg = self._get_multiple_segments_groups_message()
         message = parse_message(msg)
@@ -187,6 +197,15 @@ class TestParser(unittest.TestCase):
         self.assertEqual(msh.replace('\r',''), segments[0].to_er7())
         self.assertEqual(pid, segments[1].to_er7())
 
+    def test_parse_segments_crlf(self):
+        msh = 'MSH|^~\&|SENDING APP|SENDING FAC|REC APP|REC FAC|20080115153000||ADT^A01^ADT_A01|0123456789|P|2.5||||AL\r\n'
+        pid = 'PID|1||123-456-789^^^HOSPITAL^MR||SURNAME^NAME^A|||M|||1111 SOMEWHERE STREET^^SOMEWHERE^^^USA||555-555-2004~444-333-222|||M'
+
+        segments = parse_segments(msh+pid)
+        self.assertEqual(len(segments), 2)
+        self.assertEqual(msh.strip(), segments[0].to_er7())
+        self.assertEqual(pid, segments[1].to_er7())
+
     def test_parse_segment(self):
         segment = 'PV1|1|I|PATIENT WARD|U||||^REFERRING^DOCTOR|^CONSULTING^DOCTOR|CAR||||2|A0|||||||||||||||||||||||||||||2008'
         pv1 = parse_segment(segment)